@@ -1,10 +1,14 @@
 import streamlit as st
-import cv2
 import numpy as np
-import pandas as pd
-import time
 import os
-import matplotlib.pyplot as plt
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_source import DecoderPool, FrameCache, FrameSource, Prefetcher, display_path, encode_jpeg
+from gait import get_ai_insights, synthetic_gait_data
+from playback import FrameSkipPolicy, PlaybackClock
+from pose import PoseModel, extract_gait_data
+from plots import JointAnglePlot, joint_angle_chart_data, joint_angle_chart_spec, prerender_plot_frames
 
 # --- Page Configuration & Theming ---
 st.set_page_config(
@@ -43,49 +47,112 @@ st.markdown("""
 # --- Configuration & Data Generation ---
 VIDEO_1_PATH = "video_1.mp4"
 VIDEO_2_PATH = "video_2.mp4"
-VIDEO_DURATION_SECONDS = 6.0
 FPS = 30
+# Sample rate of the synthetic angles shown when no pose model is available.
+GAIT_SAMPLE_RATE_HZ = 30
+PLAYBACK_RATES = [0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0]
+MAX_TICK_FPS = 30
+DECODER_IDLE_TIMEOUT_SECONDS = 60.0
+FRAME_CACHE_MB = 256
+PREFETCH_FRAMES = 15
+JPEG_CACHE_MB = 64
+DISPLAY_WIDTH = 640
+JPEG_QUALITY = 80
+# ONNX export of OpenPose BODY_25; without it the dashboard shows synthetic angles.
+POSE_MODEL_PATH = os.environ.get("POSE_MODEL_PATH", "models/body_25.onnx")
+POSE_BATCH_SIZE = 8
+# Run the model every N frames and track keypoints with optical flow in between; see bench_pose.py.
+POSE_DETECT_INTERVAL = 1
+# Crop each frame to the subject before inference.
+POSE_PERSON_ROI = True
+
+# Cached as a shared resource rather than with cache_data, which would unpickle
+# a fresh copy on every playback tick; JointAngles arrays are read-only.
+@st.cache_resource(show_spinner="Estimating joint angles...")
+def get_gait_data(video_path):
+    if os.path.exists(POSE_MODEL_PATH):
+        return extract_gait_data(video_path, PoseModel(POSE_MODEL_PATH), POSE_BATCH_SIZE,
+                                 POSE_DETECT_INTERVAL, POSE_PERSON_ROI)
+    duration = get_video_duration(video_path)
+    return synthetic_gait_data(duration, int(duration * GAIT_SAMPLE_RATE_HZ))
+
+@st.cache_resource(max_entries=4, on_release=JointAnglePlot.close)
+def get_joint_angle_plot(video_path):
+    return JointAnglePlot(get_gait_data(video_path), get_video_duration(video_path))
+
+@st.cache_resource(max_entries=4, show_spinner="Pre-rendering plot frames...")
+def get_prerendered_plot_frames(video_path):
+    return prerender_plot_frames(get_gait_data(video_path), get_video_duration(video_path))
+
+@st.cache_resource
+def get_joint_angle_chart_data(video_path):
+    return joint_angle_chart_data(get_gait_data(video_path), get_video_duration(video_path))
 
-@st.cache_data
-def generate_gait_data(duration, num_points):
-    t = np.linspace(0, duration, num_points)
-    gait_cycle_duration = 1.1
-    w = 2 * np.pi / gait_cycle_duration
-    right_hip = -18 * np.cos(w * t) + 12
-    left_hip = -18 * np.cos(w * t + np.pi) + 12
-    right_knee = 35 * (1 - np.cos(w * t + 0.2)) / 2 + 15 * np.sin(w * t - 0.5)**4
-    left_knee = 35 * (1 - np.cos(w * t + np.pi + 0.2)) / 2 + 15 * np.sin(w * t + np.pi - 0.5)**4
-    right_ankle = 12 * np.sin(w * t - np.pi * 0.45) - 5
-    left_ankle = 12 * np.sin(w * t + np.pi - np.pi * 0.45) - 5
-    data = pd.DataFrame({
-        "Time": t, "Left Hip Flexion": left_hip, "Right Hip Flexion": right_hip,
-        "Left Knee Flexion": left_knee, "Right Knee Flexion": right_knee,
-        "Left Ankle Dorsiflexion": left_ankle, "Right Ankle Dorsiflexion": right_ankle
-    }).set_index("Time")
-    return data
-
-def get_ai_insights(t):
-    cycle_time = t % 2.2
-    if 0 <= cycle_time < 0.2: return {"title": "Right Heel Strike", "finding": "Initiating stance phase on the right leg. Hip is flexed (~25°), knee is near full extension to accept weight.", "status": "Normal"}
-    elif 0.2 <= cycle_time < 0.8: return {"title": "Left Swing Phase", "finding": "Left leg is in swing. Peak knee flexion (~65°) and ankle dorsiflexion ensure adequate ground clearance.", "status": "Normal"}
-    elif 0.8 <= cycle_time < 1.3: return {"title": "Right Push-Off", "finding": "Powerful ankle plantarflexion detected, propelling the body forward.", "status": "Good"}
-    elif 1.3 <= cycle_time < 1.5: return {"title": "Left Heel Strike", "finding": "Symmetry check: Left leg makes initial contact. Angles show good bilateral symmetry.", "status": "Symmetrical"}
-    elif 1.5 <= cycle_time < 2.0: return {"title": "Right Swing Phase", "finding": "Right leg is now in swing. Hip flexion is increasing towards its peak.", "status": "Normal"}
-    else: return {"title": "Overall Assessment", "finding": "Gait pattern appears stable and rhythmic. Cadence is estimated at ~110 steps/minute.", "status": "Stable"}
-
-def get_frame_at_time(video_path, time_sec):
-    cap = cv2.VideoCapture(video_path)
-    cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
-    ret, frame = cap.read()
-    cap.release()
-    if ret: return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    return None
+@st.cache_resource
+def get_frame_source():
+    pool = DecoderPool(idle_timeout=DECODER_IDLE_TIMEOUT_SECONDS)
+    cache = FrameCache(max_bytes=FRAME_CACHE_MB * 1024 * 1024)
+    return FrameSource(pool, cache)
+
+# The timeline runs to the last frame's presentation time.
+def get_video_duration(video_path):
+    return float(get_frame_source().pool.index(video_path).timestamps_ms[-1]) / 1000
+
+@st.cache_resource
+def get_jpeg_cache():
+    return FrameCache(max_bytes=JPEG_CACHE_MB * 1024 * 1024, sizeof=len)
+
+def get_prefetcher(video_path):
+    key = f"prefetcher:{video_path}"
+    if key not in st.session_state:
+        st.session_state[key] = Prefetcher(get_frame_source(), video_path, depth=PREFETCH_FRAMES)
+    return st.session_state[key]
+
+@st.cache_resource
+def get_decode_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="decode")
+
+# Runs on the decode executor, so it must not touch st.* APIs.
+# Returns JPEG bytes at display width, which st.image passes through without re-encoding.
+def get_frame_at_time(source, jpeg_cache, video_path, time_sec, prefetcher=None, stride=1):
+    index = source.frame_index(video_path, time_sec)
+    # Popped even when the JPEG is cached, so the read-ahead window and idle timer keep moving.
+    frame = prefetcher.pop(index, stride) if prefetcher is not None else None
+    key = (video_path, index, DISPLAY_WIDTH, JPEG_QUALITY)
+    encoded = jpeg_cache.get(key)
+    if encoded is not None: return encoded
+    if frame is None: frame = source.get_frame(video_path, time_sec)
+    if frame is None: return None
+    encoded = encode_jpeg(frame, DISPLAY_WIDTH, JPEG_QUALITY)
+    jpeg_cache.put(key, encoded)
+    return encoded
+
+def get_frames_at_time(video_paths, time_sec, stride=1):
+    source = get_frame_source()
+    jpeg_cache = get_jpeg_cache()
+    # Interactive playback reads the low-res proxies from `python frame_source.py proxy` when present.
+    video_paths = [display_path(path) for path in video_paths]
+    prefetchers = []
+    for path in video_paths:
+        prefetcher = get_prefetcher(path)
+        # Videos with a frame store are read straight from the memory map.
+        if st.session_state.play and source.store(path) is None:
+            prefetchers.append(prefetcher)
+        else:
+            prefetcher.stop()
+            prefetchers.append(None)
+    # OpenCV releases the GIL while decoding and encoding, so the videos are processed in parallel.
+    futures = [get_decode_executor().submit(get_frame_at_time, source, jpeg_cache, path, time_sec, prefetcher, stride)
+               for path, prefetcher in zip(video_paths, prefetchers)]
+    return [future.result() for future in futures]
 
 # --- Main Application ---
 st.title("🏃‍♂️ Real-Time Gait Analysis Dashboard")
 
 if 'play' not in st.session_state: st.session_state.play = False
 if 'time' not in st.session_state: st.session_state.time = 0.0
+if 'clock' not in st.session_state: st.session_state.clock = PlaybackClock(FPS)
+if 'skip_policy' not in st.session_state: st.session_state.skip_policy = FrameSkipPolicy(FPS, MAX_TICK_FPS)
 
 st.sidebar.header("Controls")
 if st.sidebar.button("▶️ Play / ⏸️ Pause", use_container_width=True):
@@ -96,83 +163,105 @@ if st.sidebar.button("🔄 Reset", use_container_width=True):
     st.session_state.time = 0.0
     st.rerun()
 
-time_slider = st.sidebar.slider("Timeline (seconds)", 0.0, VIDEO_DURATION_SECONDS, st.session_state.time, 0.01)
+duration = get_video_duration(VIDEO_1_PATH)
+time_slider = st.sidebar.slider("Timeline (seconds)", 0.0, duration, st.session_state.time, 0.01)
 if time_slider != st.session_state.time:
     st.session_state.time = time_slider
     st.session_state.play = False
 
-gait_data = generate_gait_data(VIDEO_DURATION_SECONDS, int(VIDEO_DURATION_SECONDS * FPS))
-current_data_index = min(int(st.session_state.time * FPS), len(gait_data) - 1)
-current_data_point = gait_data.iloc[current_data_index]
-
-main_cols = st.columns([2, 1], gap="large")
-
-with main_cols[0]:
-    vid_cols = st.columns(2)
-    frame1 = get_frame_at_time(VIDEO_1_PATH, st.session_state.time)
-    frame2 = get_frame_at_time(VIDEO_2_PATH, st.session_state.time)
-
-    with vid_cols[0]:
-        st.subheader("Original Video")
-        if frame1 is not None: st.image(frame1)
-    with vid_cols[1]:
-        st.subheader("3D Motion Overlay")
-        if frame2 is not None: st.image(frame2)
-
-    st.markdown("---")
-    st.subheader("Joint Angle Plots")
-
-    plot_data_until_now = gait_data[gait_data.index <= st.session_state.time]
-    fig, axs = plt.subplots(2, 3, figsize=(15, 6))
-    fig.tight_layout(pad=4.0)
-
-    plot_titles = [
-        "Left Hip Flexion", "Right Hip Flexion", "Left Knee Flexion",
-        "Right Knee Flexion", "Left Ankle Dorsiflexion", "Right Ankle Dorsiflexion"
-    ]
-    
-    for i, title in enumerate(plot_titles):
-        ax = axs[i // 3, i % 3]
-        ax.plot(gait_data.index, gait_data[title], color='gray', linestyle='--', alpha=0.5)
-        if not plot_data_until_now.empty:
-            ax.plot(plot_data_until_now.index, plot_data_until_now[title], color='dodgerblue', linewidth=2)
-            ax.plot(plot_data_until_now.index[-1], plot_data_until_now[title].iloc[-1], 'o', color='red', markersize=8)
-        
-        ax.set_title(title)
-        ax.set_xlabel("Time (s)")
-        ax.set_ylabel("Angle (°)")
-        ax.set_xlim([0, VIDEO_DURATION_SECONDS])
-        ax.grid(True, linestyle=':', alpha=0.6)
-
-    st.pyplot(fig)
-
-with main_cols[1]:
-    st.subheader("🤖 AI Gait Insights")
-    insights = get_ai_insights(st.session_state.time)
-    status_color = {"Normal": "blue", "Symmetrical": "green", "Good": "green", "Stable": "violet"}.get(insights["status"], "gray")
-    with st.container(border=True):
-        st.info(f"**Phase:** {insights['title']}")
-        st.markdown(f"**Finding:** {insights['finding']}")
-        st.markdown(f"**Status:** :{status_color}[{insights['status']}]")
-
-    st.markdown("---")
-    st.subheader("Current Data Points")
-    metric_cols = st.columns(2)
-    metric_cols[0].metric("Left Knee Flexion", f"{current_data_point['Left Knee Flexion']:.1f}°")
-    metric_cols[1].metric("Right Knee Flexion", f"{current_data_point['Right Knee Flexion']:.1f}°")
-    metric_cols[0].metric("Left Hip Flexion", f"{current_data_point['Left Hip Flexion']:.1f}°")
-    metric_cols[1].metric("Right Hip Flexion", f"{current_data_point['Right Hip Flexion']:.1f}°")
-    metric_cols[0].metric("Left Ankle Angle", f"{current_data_point['Left Ankle Dorsiflexion']:.1f}°")
-    metric_cols[1].metric("Right Ankle Angle", f"{current_data_point['Right Ankle Dorsiflexion']:.1f}°")
-
-# --- Playback Loop ---
+playback_rate = st.sidebar.select_slider("Playback speed", PLAYBACK_RATES, value=1.0, format_func=lambda rate: f"{rate:g}×")
+adaptive_skip = st.sidebar.checkbox("Adaptive frame skipping", value=True,
+                                    help="When rendering can't keep up, step several frames per tick on a regular grid instead of dropping frames unevenly.")
+
+plot_renderer = st.sidebar.radio("Plot rendering", ["Server (matplotlib)", "Browser (Vega-Lite)"],
+                                 help="Browser rendering ships the series once per chart and draws the progress client-side.")
+prerender_plots = st.sidebar.checkbox("Pre-render plot frames", disabled=plot_renderer != "Server (matplotlib)",
+                                      help="Render every plot frame once up front so playback only looks images up.")
+
+clock = st.session_state.clock
+skip_policy = st.session_state.skip_policy
 if st.session_state.play:
-    if st.session_state.time >= VIDEO_DURATION_SECONDS:
+    if not clock.running or clock.rate != playback_rate: clock.start(st.session_state.time, playback_rate)
+else:
+    clock.stop()
+
+# --- Live View ---
+# Everything above runs once per interaction. During playback only this
+# fragment reruns, on a timer of at most MAX_TICK_FPS; it renders all panes
+# for one instant, so they stay in sync. The clock picks the frame that is due
+# by wall time at the chosen speed, so slow ticks skip frames instead of
+# slowing playback down, stepping `stride` frames at a time when adaptive.
+@st.fragment(run_every=1 / skip_policy.tick_fps(playback_rate) if st.session_state.play else None)
+def live_view():
+    tick_start = time.perf_counter()
+    stride = skip_policy.stride(playback_rate) if adaptive_skip else 1
+    if st.session_state.play:
+        st.session_state.time = min(clock.tick(stride), duration)
+
+    gait_data = get_gait_data(VIDEO_1_PATH)
+    current_data_index = max(int(np.searchsorted(gait_data.times, st.session_state.time, side="right")) - 1, 0)
+
+    main_cols = st.columns([2, 1], gap="large")
+
+    with main_cols[0]:
+        vid_cols = st.columns(2)
+        frame1, frame2 = get_frames_at_time([VIDEO_1_PATH, VIDEO_2_PATH], st.session_state.time, stride)
+
+        with vid_cols[0]:
+            st.subheader("Original Video")
+            if frame1 is not None: st.image(frame1, output_format="JPEG")
+        with vid_cols[1]:
+            st.subheader("3D Motion Overlay")
+            if frame2 is not None: st.image(frame2, output_format="JPEG")
+
+        stats = []
+        if st.session_state.play:
+            stats.append(f"Playback: {playback_rate:g}× every {stride} frame(s), "
+                         f"{clock.achieved_fps:.1f} FPS, {clock.dropped_frames} frames skipped")
+        for name, cache, budget_mb in [("JPEG cache", get_jpeg_cache(), JPEG_CACHE_MB),
+                                       ("Frame cache", get_frame_source().cache, FRAME_CACHE_MB)]:
+            cache_stats = cache.stats()
+            stats.append(f"{name}: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                         f"{cache_stats['bytes'] / 2**20:.0f} of {budget_mb} MB")
+        st.caption(f"{st.session_state.time:.2f} s · " + " · ".join(stats))
+
+        st.markdown("---")
+        st.subheader("Joint Angle Plots")
+
+        if plot_renderer == "Browser (Vega-Lite)":
+            chart_data = get_joint_angle_chart_data(VIDEO_1_PATH)
+            st.vega_lite_chart(chart_data, joint_angle_chart_spec(duration, st.session_state.time))
+        elif prerender_plots:
+            plot_frames = get_prerendered_plot_frames(VIDEO_1_PATH)
+            st.image(plot_frames[np.searchsorted(gait_data.times, st.session_state.time, side="right")], output_format="PNG")
+        else:
+            plot = get_joint_angle_plot(VIDEO_1_PATH)
+            st.image(plot.render_png(st.session_state.time), output_format="PNG")
+
+    with main_cols[1]:
+        st.subheader("🤖 AI Gait Insights")
+        insights = get_ai_insights(st.session_state.time)
+        status_color = {"Normal": "blue", "Symmetrical": "green", "Good": "green", "Stable": "violet"}.get(insights["status"], "gray")
+        with st.container(border=True):
+            st.info(f"**Phase:** {insights['title']}")
+            st.markdown(f"**Finding:** {insights['finding']}")
+            st.markdown(f"**Status:** :{status_color}[{insights['status']}]")
+
+        st.markdown("---")
+        st.subheader("Current Data Points")
+        metric_cols = st.columns(2)
+        metric_cols[0].metric("Left Knee Flexion", f"{gait_data.value('Left Knee Flexion', current_data_index):.1f}°")
+        metric_cols[1].metric("Right Knee Flexion", f"{gait_data.value('Right Knee Flexion', current_data_index):.1f}°")
+        metric_cols[0].metric("Left Hip Flexion", f"{gait_data.value('Left Hip Flexion', current_data_index):.1f}°")
+        metric_cols[1].metric("Right Hip Flexion", f"{gait_data.value('Right Hip Flexion', current_data_index):.1f}°")
+        metric_cols[0].metric("Left Ankle Angle", f"{gait_data.value('Left Ankle Dorsiflexion', current_data_index):.1f}°")
+        metric_cols[1].metric("Right Ankle Angle", f"{gait_data.value('Right Ankle Dorsiflexion', current_data_index):.1f}°")
+
+    if st.session_state.play: skip_policy.record(time.perf_counter() - tick_start)
+
+    # Reaching the end needs a full rerun to stop the timer and refresh the controls.
+    if st.session_state.play and st.session_state.time >= duration:
         st.session_state.play = False
-    else:
-        time_increment = 1 / FPS
-        st.session_state.time += time_increment
-        st.session_state.time = min(st.session_state.time, VIDEO_DURATION_SECONDS)
+        st.rerun()
 
-    time.sleep(0.02)
-    st.rerun()
+live_view()
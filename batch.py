@@ -0,0 +1,115 @@
+"""Headless gait analysis of a directory of videos, without Streamlit.
+
+Videos are spread over a process pool. Each worker loads the pose model
+once and reuses it for every video it is handed. Per video, the joint angles
+are written to `<video>.csv` and a summary with angle ranges and the insight
+timeline to `<video>.json`. A throughput summary is written to
+`summary.json`. Pose results are cached beside each video by content hash,
+so re-running over an unchanged archive skips inference.
+
+    python batch.py videos/ --model models/body_25.onnx --out results/ --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from gait import get_ai_insights
+from pose import PoseModel, extract_gait_data
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+
+_worker_model = None
+
+
+def _init_worker(model_path, threads):
+    global _worker_model
+    # Split the cores between workers instead of every worker's DNN claiming all of them.
+    cv2.setNumThreads(threads)
+    _worker_model = PoseModel(model_path)
+
+
+def insight_timeline(times):
+    """Runs of consecutive samples sharing an insight, as [start, stop, title, status] rows."""
+    timeline = []
+    for t in times:
+        insight = get_ai_insights(t)
+        if timeline and timeline[-1][2] == insight["title"]:
+            timeline[-1][1] = float(t)
+        else:
+            timeline.append([float(t), float(t), insight["title"], insight["status"]])
+    return timeline
+
+
+def analyse(path, out_dir, batch_size, interval, roi):
+    start = time.perf_counter()
+    data = extract_gait_data(path, _worker_model, batch_size, interval, roi)
+    # The extension stays in the name, so a.mp4 and a.mov don't overwrite each other.
+    name = os.path.basename(path)
+    data.to_dataframe().to_csv(os.path.join(out_dir, f"{name}.csv"))
+    joints = {joint: {"min": float(data.series(joint).min()), "max": float(data.series(joint).max()),
+                      "mean": float(data.series(joint).mean())} for joint in data.names} if len(data) else {}
+    result = {"video": path, "frames": len(data), "duration": float(data.times[-1]) if len(data) else 0.0,
+              "seconds": time.perf_counter() - start}
+    with open(os.path.join(out_dir, f"{name}.json"), "w") as f:
+        json.dump({**result, "joints": joints, "insights": insight_timeline(data.times)}, f, indent=2)
+    return result
+
+
+def find_videos(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(VIDEO_EXTENSIONS) and ".proxy." not in name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("videos", help="directory of videos")
+    parser.add_argument("--model", required=True, help="ONNX export of OpenPose BODY_25")
+    parser.add_argument("--out", default="results")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--interval", type=int, default=1, help="run the model every N frames and track in between")
+    parser.add_argument("--no-roi", action="store_true", help="run the model on whole frames")
+    args = parser.parse_args()
+
+    videos = find_videos(args.videos)
+    os.makedirs(args.out, exist_ok=True)
+    workers = min(args.workers or os.cpu_count() or 1, max(len(videos), 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    results, failures = [], []
+    start = time.perf_counter()
+    # Spawned rather than forked, like the plot pre-renderer, so OpenCV's thread pools start clean.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(args.model, threads)) as pool:
+        futures = {pool.submit(analyse, path, args.out, args.batch_size, args.interval, not args.no_roi): path
+                   for path in videos}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({"video": futures[future], "error": str(e)})
+                print(f"failed  {futures[future]}: {e}", file=sys.stderr)
+                continue
+            results.append(result)
+            print(f"done    {result['video']}: {result['frames']} frames in {result['seconds']:.1f} s")
+    elapsed = time.perf_counter() - start
+
+    frames = sum(result["frames"] for result in results)
+    summary = {"videos": len(results), "failed": failures, "frames": frames, "workers": workers,
+               "seconds": elapsed, "videos_per_minute": len(results) / elapsed * 60 if elapsed else 0.0,
+               "frames_per_second": frames / elapsed if elapsed else 0.0}
+    with open(os.path.join(args.out, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"{len(results)} videos ({len(failures)} failed), {frames} frames in {elapsed:.1f} s: "
+          f"{summary['videos_per_minute']:.1f} videos/min, {summary['frames_per_second']:.1f} frames/s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Memory regression benchmark: drives the dashboard through many reruns.
+
+Runs app.py headlessly with Streamlit's AppTest, moving the timeline by one
+frame per rerun, and reports Python heap growth (tracemalloc), process RSS and
+the number of live matplotlib figures after a warm-up pass. Exits non-zero
+when heap growth exceeds the budget or figures accumulate.
+
+    python bench_memory.py --reruns 1000 --max-growth-mb 20
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+from matplotlib.figure import Figure
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def live_figures():
+    return sum(isinstance(obj, Figure) for obj in gc.get_objects())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=200, help="reruns before the baseline is taken")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    slider = at.sidebar.slider[0]
+    duration = slider.max
+    step = 1 / args.fps
+
+    def rerun(i):
+        at.sidebar.slider[0].set_value(round((i * step) % duration, 2)).run()
+        if at.exception:
+            sys.exit(f"rerun {i} raised: {at.exception[0].value}")
+
+    tracemalloc.start()
+    for i in range(args.warmup):
+        rerun(i)
+    gc.collect()
+    heap_before, _ = tracemalloc.get_traced_memory()
+    rss_before, figures_before = rss_mb(), live_figures()
+
+    start = time.perf_counter()
+    for i in range(args.warmup, args.warmup + args.reruns):
+        rerun(i)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    heap_after, heap_peak = tracemalloc.get_traced_memory()
+    rss_after, figures_after = rss_mb(), live_figures()
+
+    growth_mb = (heap_after - heap_before) / 2**20
+    print(f"reruns:        {args.reruns} ({elapsed / args.reruns * 1000:.1f} ms/rerun)")
+    print(f"python heap:   {heap_before / 2**20:.1f} -> {heap_after / 2**20:.1f} MB "
+          f"(growth {growth_mb:+.1f} MB, peak {heap_peak / 2**20:.1f} MB)")
+    print(f"process RSS:   {rss_before:.1f} -> {rss_after:.1f} MB")
+    print(f"live figures:  {figures_before} -> {figures_after}")
+    if growth_mb > args.max_growth_mb or figures_after > figures_before:
+        sys.exit("memory regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Plot rendering benchmark: live blitted rendering vs. pre-rendered frames.
+
+Both are timed as the dashboard pays for them per rerun, including the image
+handling st.image does before serving the bytes: live rendering is a blit
+plus PNG encode, pre-rendered playback a lookup into the frames produced
+once by the process pool, whose one-off cost is reported separately.
+
+    python bench_plots.py --duration 6 --fps 30 --workers 4
+"""
+import argparse
+import time
+
+import numpy as np
+from streamlit.elements.lib.image_utils import image_to_url
+from streamlit.elements.lib.layout_utils import LayoutConfig
+
+from gait import synthetic_gait_data
+from plots import JointAnglePlot, prerender_plot_frames
+
+
+def show(png):
+    # What st.image(png, output_format="PNG") does; outside a running server no URL is made.
+    image_to_url(png, LayoutConfig(width="content"), False, "RGB", "PNG", "bench")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=6.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    angles = synthetic_gait_data(args.duration, int(args.duration * args.fps))
+    times = angles.times
+
+    plot = JointAnglePlot(angles, args.duration)
+    start = time.perf_counter()
+    for t in times:
+        show(plot.render_png(t))
+    live_ms = (time.perf_counter() - start) / len(times) * 1000
+
+    start = time.perf_counter()
+    frames = prerender_plot_frames(angles, args.duration, workers=args.workers)
+    prerender_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for t in times:
+        show(frames[np.searchsorted(times, t, side="right")])
+    lookup_ms = (time.perf_counter() - start) / len(times) * 1000
+
+    print(f"frames:           {len(frames)} ({sum(map(len, frames)) / 2**20:.1f} MB encoded)")
+    print(f"live render:      {live_ms:.2f} ms/frame")
+    print(f"pre-render:       {prerender_s:.2f} s once")
+    print(f"pre-rendered:     {lookup_ms:.4f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
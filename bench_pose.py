@@ -0,0 +1,63 @@
+"""Pose inference benchmark: full-frame dense inference vs. subject crops and keyframe-sparse tracking.
+
+Runs the model on every whole frame once as the reference, then on crops
+around the subject, then detecting only every k frames and tracking
+keypoints with optical flow in between, reporting the throughput, the
+number of model runs and how far the joint angles and keypoints drift from
+the reference.
+
+    python bench_pose.py video_1.mp4 --model models/body_25.onnx --intervals 2 5 10
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from pose import MIN_CONFIDENCE, PoseModel, estimate_poses, joint_angles, track_poses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("video")
+    parser.add_argument("--model", required=True, help="ONNX export of OpenPose BODY_25")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--no-roi", action="store_true", help="track on whole frames instead of subject crops")
+    args = parser.parse_args()
+
+    model = PoseModel(args.model)
+    cap = cv2.VideoCapture(args.video)
+    full_size = model.input_size(cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    crop_size = model.input_size(model.roi_aspect, 1)
+    print(f"network input: whole frame {full_size[0]}x{full_size[1]}, subject crop {crop_size[0]}x{crop_size[1]} "
+          f"({full_size[0] * full_size[1] / (crop_size[0] * crop_size[1]):.1f}x fewer pixels)")
+
+    start = time.perf_counter()
+    keypoints, confidence = estimate_poses(args.video, model, args.batch_size, roi=False)
+    dense_s = time.perf_counter() - start
+    angles = joint_angles(keypoints, confidence)
+    frames = len(keypoints)
+    confident = confidence >= MIN_CONFIDENCE
+
+    def report(mode, runs, seconds, run_keypoints, run_confidence):
+        angle_error = np.abs(joint_angles(run_keypoints, run_confidence) - angles).mean()
+        # Median distance over the keypoints the reference detected confidently.
+        keypoint_error = np.median(np.linalg.norm(run_keypoints - keypoints, axis=-1)[confident])
+        print(f"{mode:<10} {runs:>10} {frames / seconds:>9.1f} {dense_s / seconds:>8.1f}x "
+              f"{angle_error:>9.2f}° {keypoint_error:>12.1f}")
+
+    print(f"{'mode':<10} {'model runs':>10} {'frames/s':>9} {'speed-up':>9} {'angle MAE':>10} {'keypoint px':>12}")
+    report("dense", frames, dense_s, keypoints, confidence)
+    start = time.perf_counter()
+    roi_keypoints, roi_confidence = estimate_poses(args.video, model, args.batch_size, roi=True)
+    report("dense roi", frames, time.perf_counter() - start, roi_keypoints, roi_confidence)
+    for interval in args.intervals:
+        start = time.perf_counter()
+        sparse_keypoints, sparse_confidence, detections = track_poses(args.video, model, interval, not args.no_roi)
+        report(f"k={interval}", detections, time.perf_counter() - start, sparse_keypoints, sparse_confidence)
+
+
+if __name__ == "__main__":
+    main()
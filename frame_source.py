@@ -0,0 +1,526 @@
+import argparse
+import atexit
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+
+OPENCV_SEEK_BACKOFF = 16
+PROXY_WIDTH = 640
+
+
+class FrameIndex:
+    """Presentation timestamps and keyframe positions of every frame in a video.
+
+    Built once by walking the packets without decoding them and saved beside
+    the video as `<video>.frameidx.npz`; it is rebuilt when the video's size
+    or modification time changes.
+    """
+
+    SUFFIX = ".frameidx.npz"
+
+    def __init__(self, timestamps_ms, keyframes):
+        self.timestamps_ms = timestamps_ms
+        self.keyframes = keyframes
+
+    def __len__(self):
+        return len(self.timestamps_ms)
+
+    def frame_at(self, time_sec):
+        # Half a millisecond of slack absorbs float drift in accumulated playback time.
+        index = np.searchsorted(self.timestamps_ms, time_sec * 1000 + 0.5, side="right") - 1
+        return int(min(max(index, 0), len(self) - 1))
+
+    def keyframe_before(self, index):
+        return int(self.keyframes[np.searchsorted(self.keyframes, index, side="right") - 1])
+
+    def seek_cost(self, index):
+        """Frames decoded by OpenCV to land on `index` after a seek."""
+        # The FFmpeg backend seeks to the keyframe before index - 16 and decodes forward.
+        return index - self.keyframe_before(max(index - OPENCV_SEEK_BACKOFF, 0))
+
+    @classmethod
+    def load(cls, path):
+        stat = os.stat(path)
+        try:
+            with np.load(path + cls.SUFFIX) as saved:
+                if saved["source_size"] == stat.st_size and saved["source_mtime"] == stat.st_mtime:
+                    return cls(saved["timestamps_ms"], saved["keyframes"])
+        except (OSError, KeyError, ValueError):
+            pass
+        index = cls.build(path)
+        try:
+            np.savez(path + cls.SUFFIX, timestamps_ms=index.timestamps_ms, keyframes=index.keyframes,
+                     source_size=stat.st_size, source_mtime=stat.st_mtime)
+        except OSError:
+            pass
+        return index
+
+    @classmethod
+    def build(cls, path):
+        # CAP_PROP_FORMAT=-1 makes grab() return raw packets, so nothing is decoded.
+        cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        pts, is_key = [], []
+        while cap.grab():
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+            is_key.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))
+        cap.release()
+        if pts and any(is_key):
+            # Packets arrive in decode order; frame numbers follow presentation order.
+            order = np.argsort(pts, kind="stable")
+            timestamps_ms = np.asarray(pts, dtype=np.float64)[order]
+            # Frame 0 is always a valid seek target, even when it isn't flagged (open GOPs).
+            keyframes = np.union1d([0], np.flatnonzero(np.asarray(is_key, dtype=bool)[order]))
+            return cls(timestamps_ms, keyframes)
+        # Backend without raw packet access: assume constant frame rate and let
+        # OpenCV seek to any frame.
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+        cap.release()
+        return cls(np.arange(count) * 1000.0 / fps, np.arange(count))
+
+
+class Decoder:
+    """An open VideoCapture for one video file.
+
+    Tracks which frame the capture will return next so that playback, which
+    asks for consecutive frames, is served by plain reads. Any other frame is
+    reached by whichever of decoding forward from the current position or
+    seeking (decoding forward from an earlier keyframe) touches fewer frames,
+    so the cost of a jump is bounded by the keyframe spacing.
+    """
+
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+        self.cap = cv2.VideoCapture(path)
+        self.next_index = None
+        self.last_index = None
+        self.last_frame = None
+        self.last_used = time.monotonic()
+
+    def is_open(self):
+        return self.cap.isOpened()
+
+    def frame_index(self, time_sec):
+        return self.index.frame_at(time_sec)
+
+    def is_sequential(self, index):
+        if index == self.last_index:
+            return True
+        return (self.next_index is not None
+                and 0 <= index - self.next_index <= self.index.seek_cost(index))
+
+    def read(self, index):
+        if index == self.last_index:
+            return self.last_frame
+        if self.is_sequential(index):
+            ok = all(self.cap.grab() for _ in range(index - self.next_index))
+        else:
+            ok = self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self.cap.read() if ok else (False, None)
+        if not ret:
+            self.next_index = self.last_index = self.last_frame = None
+            return None
+        self.next_index = index + 1
+        self.last_index = index
+        self.last_frame = frame
+        return frame
+
+    def read_at(self, time_sec):
+        return self.read(self.frame_index(time_sec))
+
+    def release(self):
+        self.cap.release()
+
+
+class DecoderPool:
+    """Keeps decoders open between reruns so a frame fetch doesn't pay for the
+    container open and demux probe every time.
+
+    A decoder is handed to one caller at a time, preferring one that can reach
+    frame `index` without seeking. Idle decoders are released after
+    `idle_timeout` seconds or when more than `max_idle_per_path` pile up.
+    """
+
+    def __init__(self, max_idle_per_path=2, idle_timeout=60.0):
+        self.max_idle_per_path = max_idle_per_path
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index(self, path):
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is None:
+                index = self._indexes[path] = FrameIndex.load(path)
+            return index
+
+    @contextmanager
+    def checkout(self, path, index=None):
+        decoder = self._acquire(path, index)
+        try:
+            yield decoder
+        finally:
+            self._checkin(decoder)
+
+    def _acquire(self, path, index=None):
+        frame_index = self.index(path)
+        with self._lock:
+            self._evict_idle_locked()
+            idle = self._idle.get(path)
+            if idle:
+                # Prefer a decoder already positioned for this frame.
+                for i, d in enumerate(idle):
+                    if index is not None and d.is_sequential(index):
+                        return idle.pop(i)
+                return idle.pop()
+        return Decoder(path, frame_index)
+
+    def _checkin(self, decoder):
+        decoder.last_used = time.monotonic()
+        if not decoder.is_open():
+            decoder.release()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(decoder.path, [])
+            idle.append(decoder)
+            surplus = idle[:-self.max_idle_per_path] if len(idle) > self.max_idle_per_path else []
+            del idle[:len(surplus)]
+        for d in surplus:
+            d.release()
+
+    def _evict_idle_locked(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for path, idle in list(self._idle.items()):
+            keep = [d for d in idle if d.last_used >= cutoff]
+            for d in idle:
+                if d.last_used < cutoff:
+                    d.release()
+            if keep:
+                self._idle[path] = keep
+            else:
+                del self._idle[path]
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle_locked()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for decoders in idle.values():
+            for d in decoders:
+                d.release()
+
+
+class FrameCache:
+    """LRU cache of frames, bounded by their total size in bytes.
+
+    Values are decoded arrays by default; pass `sizeof=len` to hold encoded bytes.
+    """
+
+    def __init__(self, max_bytes, sizeof=lambda frame: frame.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        size = self.sizeof(frame)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.bytes -= self.sizeof(old)
+            self._frames[key] = frame
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.bytes -= self.sizeof(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "frames": len(self._frames), "bytes": self.bytes}
+
+
+class FrameSource:
+    """Serves frames by (video path, frame index), in OpenCV's native BGR order.
+
+    Frames come from the video's memory-mapped frame store when one has been
+    built, otherwise from the cache, otherwise from a pooled decoder.
+    """
+
+    def __init__(self, pool, cache):
+        self.pool = pool
+        self.cache = cache
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def frame_index(self, path, time_sec):
+        return self.pool.index(path).frame_at(time_sec)
+
+    def store(self, path):
+        """The memory-mapped frame store of `path`, or None if there is no up-to-date one."""
+        try:
+            store_mtime = os.stat(store_path(path)).st_mtime
+            if store_mtime < os.stat(path).st_mtime:
+                return None
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._stores.get(path)
+            if cached is None or cached[0] != store_mtime:
+                cached = self._stores[path] = (store_mtime, np.load(store_path(path), mmap_mode="r"))
+            return cached[1]
+
+    def get_frame(self, path, time_sec):
+        key = (path, self.frame_index(path, time_sec))
+        store = self.store(path)
+        if store is not None and key[1] < len(store):
+            # A view into the page cache: no decode and no copy.
+            return store[key[1]]
+        frame = self.cache.get(key)
+        if frame is not None:
+            return frame
+        with self.pool.checkout(path, key[1]) as decoder:
+            frame = self.decode(decoder, key[1])
+        if frame is not None:
+            self.cache.put(key, frame)
+        return frame
+
+    def decode(self, decoder, index):
+        frame = decoder.read(index)
+        if frame is None:
+            return None
+        # Frames are shared between sessions and threads, so hand them out read-only.
+        frame.flags.writeable = False
+        return frame
+
+
+class Prefetcher:
+    """Decodes the frames after the playhead of one video on a worker thread.
+
+    Each `pop(index, stride)` takes the frame for `index` out of a ring buffer
+    of at most `depth` frames and moves the read-ahead window to every
+    `stride`-th frame after it. The worker exits after `idle_timeout` seconds
+    without a `pop`, and is stopped and joined when the interpreter exits:
+    a daemon thread killed inside an OpenCV decode aborts the process.
+    """
+
+    def __init__(self, source, path, depth=15, idle_timeout=2.0):
+        self.source = source
+        self.path = path
+        self.depth = depth
+        self.idle_timeout = idle_timeout
+        self._buffer = OrderedDict()
+        self._next_needed = 0
+        self._stride = 1
+        self._end_index = None
+        self._last_pop = 0.0
+        self._stopped = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def pop(self, index, stride=1):
+        with self._cond:
+            frame = self._buffer.pop(index, None)
+            self._next_needed = index + stride
+            self._stride = stride
+            for stale in [i for i in self._buffer if not self._wanted(i)]:
+                del self._buffer[stale]
+            self._last_pop = time.monotonic()
+            self._stopped = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"prefetch:{self.path}", daemon=True)
+                self._thread.start()
+                _live_prefetchers.add(self)
+            self._cond.notify()
+        return frame
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._buffer.clear()
+            self._cond.notify()
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _wanted(self, index):
+        offset = index - self._next_needed
+        return 0 <= offset < self.depth * self._stride and offset % self._stride == 0
+
+    def _next_missing(self):
+        stop = self._next_needed + self.depth * self._stride
+        if self._end_index is not None:
+            stop = min(stop, self._end_index)
+        for index in range(self._next_needed, stop, self._stride):
+            if index not in self._buffer:
+                return index
+        return None
+
+    def _run(self):
+        with self.source.pool.checkout(self.path, self._next_needed) as decoder:
+            while True:
+                with self._cond:
+                    index = None
+                    while not self._stopped:
+                        index = self._next_missing()
+                        if index is not None:
+                            break
+                        if time.monotonic() - self._last_pop > self.idle_timeout:
+                            self._stopped = True
+                            break
+                        self._cond.wait(self.idle_timeout)
+                    if self._stopped:
+                        return
+                frame = self.source.decode(decoder, index)
+                with self._cond:
+                    if frame is None:
+                        self._end_index = index
+                    elif self._wanted(index):
+                        self._buffer[index] = frame
+
+
+_live_prefetchers = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_prefetchers():
+    prefetchers = list(_live_prefetchers)
+    for prefetcher in prefetchers:
+        prefetcher.stop()
+    for prefetcher in prefetchers:
+        prefetcher.join(timeout=5.0)
+
+
+def encode_jpeg(frame, width, quality):
+    """JPEG bytes of a BGR frame, downscaled to at most `width` pixels wide."""
+    height, frame_width = frame.shape[:2]
+    if frame_width > width:
+        frame = cv2.resize(frame, (width, max(1, round(height * width / frame_width))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return encoded.tobytes()
+
+
+def proxy_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.proxy{ext}"
+
+
+def display_path(path):
+    """The proxy of `path` if one has been built since the video last changed, else `path`."""
+    proxy = proxy_path(path)
+    try:
+        if os.stat(proxy).st_mtime >= os.stat(path).st_mtime:
+            return proxy
+    except OSError:
+        pass
+    return path
+
+
+def store_path(path):
+    return os.path.splitext(path)[0] + ".bgr.npy"
+
+
+def build_store(path):
+    """Decode every frame of `path` into a (frames, H, W, 3) BGR uint8 `.npy` file."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"cannot open video: {path}")
+    shape = (len(FrameIndex.load(path)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+    out_path = store_path(path)
+    tmp_path = out_path + ".tmp.npy"
+    frames = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=shape)
+    decoded = 0
+    try:
+        for i in range(shape[0]):
+            # Decodes straight into the mapped file.
+            ret, _ = cap.read(frames[i])
+            if not ret:
+                break
+            decoded += 1
+        frames.flush()
+    finally:
+        del frames
+        cap.release()
+    if decoded < shape[0]:
+        # The tail would stay zero-filled and be served as black frames.
+        os.remove(tmp_path)
+        raise ValueError(f"decoded only {decoded} of {shape[0]} frames of {path}")
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def build_proxy(path, width=PROXY_WIDTH):
+    """Transcode `path` to a `width`-pixel-wide MP4 with the same frames and frame rate."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"cannot open video: {path}")
+    src_w, src_h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    size = (width, max(2, round(src_h * width / src_w / 2) * 2)) if src_w > width else (src_w, src_h)
+    index = FrameIndex.load(path)
+    duration_ms = index.timestamps_ms[-1] - index.timestamps_ms[0]
+    fps = (len(index) - 1) * 1000 / duration_ms if duration_ms > 0 else cap.get(cv2.CAP_PROP_FPS) or 30.0
+    out_path = proxy_path(path)
+    tmp_path = out_path + ".tmp.mp4"
+    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA) if size != (src_w, src_h) else frame)
+    finally:
+        writer.release()
+        cap.release()
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline preparation of dashboard videos.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    proxy = commands.add_parser("proxy", help="build display-resolution proxies used by the dashboard")
+    proxy.add_argument("videos", nargs="+")
+    proxy.add_argument("--width", type=int, default=PROXY_WIDTH)
+    store = commands.add_parser("store", help="decode videos into memory-mapped frame stores")
+    store.add_argument("videos", nargs="+")
+    args = parser.parse_args()
+    if args.command == "proxy":
+        for video in args.videos:
+            print(build_proxy(video, args.width))
+    elif args.command == "store":
+        for video in args.videos:
+            print(build_store(video))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+JOINTS = [
+    "Left Hip Flexion", "Right Hip Flexion", "Left Knee Flexion",
+    "Right Knee Flexion", "Left Ankle Dorsiflexion", "Right Ankle Dorsiflexion"
+]
+
+
+class JointAngles:
+    """Joint angle series stored column-wise for the per-frame hot path.
+
+    `values` is a (joints x samples) float32 matrix whose rows follow `names`;
+    `times` holds the sample times in seconds. Scalar lookups index straight
+    into the matrix and windows are views, so nothing is copied per frame.
+    Both arrays are read-only, so one instance can be shared by every session
+    and rerun. Use `to_dataframe` for analysis.
+    """
+
+    def __init__(self, times, values, names=JOINTS):
+        self.times = np.array(times, dtype=np.float64, order="C")
+        self.values = np.array(values, dtype=np.float32, order="C")
+        self.times.flags.writeable = False
+        self.values.flags.writeable = False
+        self.names = list(names)
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        self._lods = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def series(self, name):
+        return self.values[self.rows[name]]
+
+    def value(self, name, index):
+        return float(self.values[self.rows[name], index])
+
+    def window(self, start_sec, stop_sec):
+        """Views of the times and values of the samples in [start_sec, stop_sec]."""
+        start = np.searchsorted(self.times, start_sec, side="left")
+        stop = np.searchsorted(self.times, stop_sec, side="right")
+        return self.times[start:stop], self.values[:, start:stop]
+
+    def lod(self, start_sec, stop_sec, width_px):
+        """Level-of-detail copy of [start_sec, stop_sec] for a plot `width_px` pixels wide.
+
+        Keeps at most the first, last, minimum and maximum sample of every
+        joint in each pixel column (M4 decimation), which draws the same
+        polyline at that width. Results are cached per zoom level.
+        """
+        key = (start_sec, stop_sec, width_px)
+        lod = self._lods.get(key)
+        if lod is None:
+            keep = m4_indices(self.times, self.values, start_sec, stop_sec, width_px)
+            lod = self._lods[key] = JointAngles(self.times[keep], self.values[:, keep], self.names)
+        return lod
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.values.T, index=pd.Index(self.times, name="Time"), columns=self.names, copy=True)
+
+    @classmethod
+    def from_dataframe(cls, data):
+        return cls(data.index.to_numpy(), data.to_numpy().T, data.columns)
+
+
+def m4_indices(times, values, start_sec, stop_sec, buckets):
+    """Sample indices kept by M4 decimation of every row of `values` into `buckets` columns."""
+    lo = np.searchsorted(times, start_sec, side="left")
+    hi = np.searchsorted(times, stop_sec, side="right")
+    n = hi - lo
+    if n <= 4 * buckets or stop_sec <= start_sec:
+        return np.arange(lo, hi)
+    column = ((times[lo:hi] - start_sec) * (buckets / (stop_sec - start_sec))).astype(np.intp)
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    position = np.arange(n)
+    keep = [starts, np.r_[starts[1:], n] - 1]
+    for row in values[:, lo:hi]:
+        for extreme in (np.minimum, np.maximum):
+            hit = row == extreme.reduceat(row, starts)[segment]
+            keep.append(np.minimum.reduceat(np.where(hit, position, n), starts))
+    return lo + np.unique(np.concatenate(keep))
+
+
+def synthetic_gait_data(duration, num_points):
+    t = np.linspace(0, duration, num_points)
+    gait_cycle_duration = 1.1
+    w = 2 * np.pi / gait_cycle_duration
+    right_hip = -18 * np.cos(w * t) + 12
+    left_hip = -18 * np.cos(w * t + np.pi) + 12
+    right_knee = 35 * (1 - np.cos(w * t + 0.2)) / 2 + 15 * np.sin(w * t - 0.5)**4
+    left_knee = 35 * (1 - np.cos(w * t + np.pi + 0.2)) / 2 + 15 * np.sin(w * t + np.pi - 0.5)**4
+    right_ankle = 12 * np.sin(w * t - np.pi * 0.45) - 5
+    left_ankle = 12 * np.sin(w * t + np.pi - np.pi * 0.45) - 5
+    return JointAngles(t, [left_hip, right_hip, left_knee, right_knee, left_ankle, right_ankle])
+
+
+def get_ai_insights(t):
+    cycle_time = t % 2.2
+    if 0 <= cycle_time < 0.2: return {"title": "Right Heel Strike", "finding": "Initiating stance phase on the right leg. Hip is flexed (~25°), knee is near full extension to accept weight.", "status": "Normal"}
+    elif 0.2 <= cycle_time < 0.8: return {"title": "Left Swing Phase", "finding": "Left leg is in swing. Peak knee flexion (~65°) and ankle dorsiflexion ensure adequate ground clearance.", "status": "Normal"}
+    elif 0.8 <= cycle_time < 1.3: return {"title": "Right Push-Off", "finding": "Powerful ankle plantarflexion detected, propelling the body forward.", "status": "Good"}
+    elif 1.3 <= cycle_time < 1.5: return {"title": "Left Heel Strike", "finding": "Symmetry check: Left leg makes initial contact. Angles show good bilateral symmetry.", "status": "Symmetrical"}
+    elif 1.5 <= cycle_time < 2.0: return {"title": "Right Swing Phase", "finding": "Right leg is now in swing. Hip flexion is increasing towards its peak.", "status": "Normal"}
+    else: return {"title": "Overall Assessment", "finding": "Gait pattern appears stable and rhythmic. Cadence is estimated at ~110 steps/minute.", "status": "Stable"}
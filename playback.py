@@ -0,0 +1,86 @@
+import math
+import time
+from collections import deque
+
+
+class PlaybackClock:
+    """Drives playback from the wall clock instead of counting reruns.
+
+    `start` anchors a media time to the current wall time; media time then
+    runs at `rate` times real time. Each `tick` returns the media time that is
+    due now, snapped to the frame grid in whole `stride`s, without sleeping:
+    frames whose slot passed while a rerun was still rendering are skipped and
+    counted in `dropped_frames` rather than slowing playback down.
+    """
+
+    def __init__(self, fps, window=30):
+        self.fps = fps
+        self.rate = 1.0
+        self.dropped_frames = 0
+        self._anchor_wall = None
+        self._anchor_media = 0.0
+        self._frame = 0
+        self._ticks = deque(maxlen=window)
+
+    @property
+    def running(self):
+        return self._anchor_wall is not None
+
+    def start(self, media_time, rate=1.0):
+        self._anchor_wall = time.monotonic()
+        self._anchor_media = media_time
+        self.rate = rate
+        self._frame = int(round(media_time * self.fps))
+        self.dropped_frames = 0
+        self._ticks.clear()
+        self._ticks.append(self._anchor_wall)
+
+    def stop(self):
+        self._anchor_wall = None
+
+    def tick(self, stride=1):
+        now = time.monotonic()
+        due = int((self._anchor_media + (now - self._anchor_wall) * self.rate) * self.fps + 1e-6)
+        frame = self._frame + max(due - self._frame, 0) // stride * stride
+        if frame > self._frame:
+            self.dropped_frames += frame - self._frame - 1
+            self._ticks.append(now)
+        self._frame = frame
+        return frame / self.fps
+
+    @property
+    def achieved_fps(self):
+        """Distinct frames shown per second over the last `window` frames."""
+        if len(self._ticks) < 2 or self._ticks[-1] == self._ticks[0]:
+            return 0.0
+        return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+
+class FrameSkipPolicy:
+    """Picks how many frames each playback tick advances.
+
+    Keeps a moving average of the time one tick takes to render. When ticks
+    can't keep up with `rate * fps` frames per second, or the timer is capped
+    at `max_tick_fps`, playback steps `stride` frames at a time so it holds
+    its speed on a regular grid instead of slowing down.
+    """
+
+    def __init__(self, fps, max_tick_fps, smoothing=0.2):
+        self.fps = fps
+        self.max_tick_fps = max_tick_fps
+        self.smoothing = smoothing
+        self.render_seconds = None
+
+    def record(self, render_seconds):
+        if self.render_seconds is None: self.render_seconds = render_seconds
+        else: self.render_seconds += self.smoothing * (render_seconds - self.render_seconds)
+
+    def tick_fps(self, rate):
+        """Ticks per second worth scheduling at `rate`."""
+        return min(rate * self.fps, self.max_tick_fps)
+
+    def stride(self, rate):
+        tick_fps = self.tick_fps(rate)
+        if self.render_seconds: tick_fps = min(tick_fps, 1 / self.render_seconds)
+        # Slack so a render that only just fits doesn't flip the stride up.
+        return max(1, math.ceil(rate * self.fps / tick_fps - 0.1))
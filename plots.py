@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import sys
+import threading
+import types
+
+import cv2
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from gait import JOINTS
+
+# Width in pixels of each subplot of the Vega-Lite chart.
+CHART_WIDTH = 260
+# Inches at 100 dpi. st.image resizes, and so re-encodes, anything wider than
+# 1460 px; at 1400 px PNG bytes pass through untouched.
+FIGURE_SIZE = (14, 6)
+
+
+def joint_angle_chart_data(angles, duration):
+    """`angles` in the long (Time, Joint, Angle) form used by the Vega-Lite chart,
+    decimated to the chart's pixel width."""
+    lod = angles.lod(0, duration, CHART_WIDTH)
+    return lod.to_dataframe()[JOINTS].reset_index().melt(id_vars="Time", var_name="Joint", value_name="Angle")
+
+
+def joint_angle_chart_spec(duration, time_sec):
+    """Vega-Lite spec of the joint angle grid, drawn by the browser.
+
+    The progress trace and marker are derived client-side from the `cursor`
+    parameter, so the server only fills in `time_sec`.
+    """
+    x = {"field": "Time", "type": "quantitative", "title": "Time (s)", "scale": {"domain": [0, duration]}}
+    y = {"field": "Angle", "type": "quantitative", "title": "Angle (°)", "scale": {"zero": False}}
+    until_cursor = {"filter": "datum.Time <= cursor"}
+    return {
+        "params": [{"name": "cursor", "value": time_sec}],
+        "facet": {"field": "Joint", "type": "nominal", "sort": JOINTS, "title": None},
+        "columns": 3,
+        "resolve": {"scale": {"y": "independent"}},
+        "spec": {
+            "width": CHART_WIDTH,
+            "height": 170,
+            "encoding": {"x": x, "y": y},
+            "layer": [
+                {"mark": {"type": "line", "color": "gray", "strokeDash": [4, 4], "opacity": 0.5}},
+                {"transform": [until_cursor], "mark": {"type": "line", "color": "dodgerblue", "strokeWidth": 2}},
+                {
+                    "transform": [
+                        until_cursor,
+                        {"joinaggregate": [{"op": "max", "field": "Time", "as": "Last"}], "groupby": ["Joint"]},
+                        {"filter": "datum.Time == datum.Last"},
+                    ],
+                    "mark": {"type": "point", "color": "red", "filled": True, "size": 80, "opacity": 1},
+                },
+            ],
+        },
+    }
+
+
+class JointAnglePlot:
+    """The 2x3 joint angle grid, with everything but the progress drawn once.
+
+    The reference traces, titles, labels and grid are rendered into a cached
+    background. Traces are drawn from a level-of-detail copy of the series
+    sized to the axes' pixel width, so cost doesn't grow with recording
+    length. Each `render` restores that background and draws only the
+    progress trace and the current-sample marker on top (blitting), then
+    returns the canvas as an RGB array. Renders are serialised by a lock, so
+    one instance can be shared by every session. Call `close` to release the
+    figure once the instance is no longer used.
+    """
+
+    def __init__(self, angles, duration):
+        self.angles = angles
+        self._times = angles.times
+        self._values = [angles.series(title) for title in JOINTS]
+        self._lock = threading.Lock()
+        # Built outside pyplot: Streamlit closes every pyplot figure after each
+        # script run, which would take the cached canvas down with it.
+        fig = Figure(figsize=FIGURE_SIZE, dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        axs = fig.subplots(2, 3)
+        fig.tight_layout(pad=4.0)
+        lod = angles.lod(0, duration, max(1, int(axs[0, 0].bbox.width)))
+        self._lod_times = lod.times
+        self._lod_values = [lod.series(title) for title in JOINTS]
+        self._fig = fig
+        self._axes = []
+        self._progress = []
+        self._markers = []
+        for i, title in enumerate(JOINTS):
+            ax = axs[i // 3, i % 3]
+            ax.plot(self._lod_times, self._lod_values[i], color='gray', linestyle='--', alpha=0.5)
+            ax.set_title(title)
+            ax.set_xlabel("Time (s)")
+            ax.set_ylabel("Angle (°)")
+            ax.set_xlim([0, duration])
+            ax.grid(True, linestyle=':', alpha=0.6)
+            progress, = ax.plot([], [], color='dodgerblue', linewidth=2, animated=True)
+            marker, = ax.plot([], [], 'o', color='red', markersize=8, animated=True)
+            self._axes.append(ax)
+            self._progress.append(progress)
+            self._markers.append(marker)
+        canvas.draw()
+        self._background = canvas.copy_from_bbox(fig.bbox)
+
+    def render(self, time_sec):
+        # Number of samples at or before time_sec; everything below is a view.
+        n = int(np.searchsorted(self._times, time_sec, side="right"))
+        m = int(np.searchsorted(self._lod_times, time_sec, side="right"))
+        with self._lock:
+            canvas = self._fig.canvas
+            canvas.restore_region(self._background)
+            if n:
+                times, lod_times = self._times, self._lod_times
+                for ax, values, lod_values, progress, marker in zip(
+                        self._axes, self._values, self._lod_values, self._progress, self._markers):
+                    progress.set_data(lod_times[:m], lod_values[:m])
+                    marker.set_data(times[n - 1:n], values[n - 1:n])
+                    ax.draw_artist(progress)
+                    ax.draw_artist(marker)
+            return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+    def render_png(self, time_sec, compression=1):
+        """`render` as PNG bytes, which st.image serves without decoding them again."""
+        frame = cv2.cvtColor(self.render(time_sec), cv2.COLOR_RGB2BGR)
+        ok, encoded = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, compression])
+        if not ok:
+            raise ValueError("PNG encoding failed")
+        return encoded.tobytes()
+
+    def close(self):
+        with self._lock:
+            self._fig.clear()
+            self._background = None
+            self._axes, self._progress, self._markers = [], [], []
+
+
+_worker_plot = None
+
+
+def _init_prerender_worker(angles, duration):
+    global _worker_plot
+    _worker_plot = JointAnglePlot(angles, duration)
+
+
+def _render_png(time_sec):
+    return _worker_plot.render_png(time_sec, compression=6)
+
+
+_spawn_lock = threading.Lock()
+
+
+def _start_spawn_pool(workers, initializer, initargs):
+    """A spawn-context Pool whose workers don't re-import the parent's __main__.
+
+    Spawned workers re-run the parent's __main__ from its file; under
+    Streamlit that is app.py, so each would run the whole dashboard. Pool
+    starts every worker in its constructor, so __main__ is only hidden for
+    that long. A __main__ set meanwhile by another session's rerun is kept.
+    """
+    with _spawn_lock:
+        main = sys.modules["__main__"]
+        placeholder = sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            return multiprocessing.get_context("spawn").Pool(workers, initializer, initargs)
+        finally:
+            if sys.modules["__main__"] is placeholder:
+                sys.modules["__main__"] = main
+
+
+def prerender_plot_frames(angles, duration, workers=None):
+    """PNG bytes of the plot for every progress position, rendered in a process pool.
+
+    Entry `k` shows the first `k` samples, so the image for time `t` is entry
+    `np.searchsorted(angles.times, t, side="right")`.
+    """
+    times = [-1.0] + list(angles.times)
+    workers = workers or os.cpu_count() or 1
+    # Spawned rather than forked: forking a threaded Streamlit server can deadlock.
+    with _start_spawn_pool(workers, _init_prerender_worker, (angles, duration)) as pool:
+        return pool.map(_render_png, times, chunksize=max(1, len(times) // (workers * 4)))
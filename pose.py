@@ -0,0 +1,293 @@
+import hashlib
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+from frame_source import FrameIndex
+from gait import JOINTS, JointAngles
+
+# OpenPose BODY_25 keypoint order.
+BODY_25 = [
+    "Nose", "Neck", "RShoulder", "RElbow", "RWrist", "LShoulder", "LElbow", "LWrist",
+    "MidHip", "RHip", "RKnee", "RAnkle", "LHip", "LKnee", "LAnkle", "REye", "LEye",
+    "REar", "LEar", "LBigToe", "LSmallToe", "LHeel", "RBigToe", "RSmallToe", "RHeel",
+]
+KEYPOINT = {name: i for i, name in enumerate(BODY_25)}
+MIN_CONFIDENCE = 0.1
+# Fewest confident keypoints that place the subject's box; below it the whole frame is searched.
+MIN_ROI_KEYPOINTS = 6
+
+
+class PoseModel:
+    """A single-person OpenPose BODY_25 network run through OpenCV DNN.
+
+    `model_path` is an ONNX export of the network with a dynamic batch
+    dimension (OpenCV 5 no longer reads the original Caffe model). The first
+    25 output channels must be the keypoint heatmaps. Frames go through the
+    network in batches; OpenCV spreads each batch over all cores.
+
+    Only the `box` region of each frame is fed to the network, scaled to
+    `input_height` pixels high; subject boxes are `roi_aspect` times as wide
+    as they are high.
+    """
+
+    def __init__(self, model_path, input_height=368, roi_aspect=0.75):
+        self.net = cv2.dnn.readNet(model_path)
+        self.input_height = input_height
+        self.roi_aspect = roi_aspect
+        # Part of the pose cache key, so changing model or resolution re-runs inference.
+        self.identity = f"{os.path.basename(model_path)}:{os.path.getsize(model_path)}:{input_height}:{roi_aspect}"
+
+    def input_size(self, width, height):
+        # The network downsamples by 8, so keep the width a multiple of it.
+        return max(8, round(self.input_height * width / height / 8) * 8), self.input_height
+
+    def blob(self, frames, box):
+        x, y, width, height = box
+        frames = [frame[y:y + height, x:x + width] for frame in frames]
+        return cv2.dnn.blobFromImages(frames, 1 / 255, self.input_size(width, height), (0, 0, 0),
+                                      swapRB=False, crop=False)
+
+    def infer(self, blob, box):
+        """Keypoints of a batch, as (frames x 25 x 2) pixel positions and (frames x 25) confidences.
+
+        `box` is the (x, y, width, height) region of the frames the blob
+        covers; keypoints are returned in full-frame coordinates.
+        """
+        self.net.setInput(blob)
+        heatmaps = self.net.forward()[:, :len(BODY_25)]
+        count, parts, height, width = heatmaps.shape
+        flat = heatmaps.reshape(count, parts, height * width)
+        peak = flat.argmax(axis=2)
+        confidence = np.take_along_axis(flat, peak[..., None], axis=2)[..., 0]
+        y, x = np.divmod(peak, width)
+        left, top, box_width, box_height = box
+        scale = np.array([box_width / width, box_height / height], dtype=np.float32)
+        keypoints = (np.stack([x, y], axis=-1) + 0.5).astype(np.float32) * scale + np.float32([left, top])
+        return keypoints, confidence.astype(np.float32)
+
+
+def person_box(keypoints, confidence, frame_shape, aspect, padding=0.2):
+    """The (x, y, width, height) box around the subject's confident keypoints, or None.
+
+    `keypoints` may hold several frames; the box covers all of them, padded
+    by `padding` of its larger side and grown to `aspect` (width / height)
+    so crops resize to the network input undistorted. It is None when fewer
+    than `MIN_ROI_KEYPOINTS` keypoints are confident.
+    """
+    points = keypoints[confidence >= MIN_CONFIDENCE]
+    if len(points) < MIN_ROI_KEYPOINTS:
+        return None
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+    pad = padding * max(x1 - x0, y1 - y0)
+    frame_height, frame_width = frame_shape[:2]
+    height = max(y1 - y0 + 2 * pad, (x1 - x0 + 2 * pad) / aspect)
+    width = min(height * aspect, frame_width)
+    height = min(height, frame_height)
+    x = min(max((x0 + x1 - width) / 2, 0), frame_width - width)
+    y = min(max((y0 + y1 - height) / 2, 0), frame_height - height)
+    return int(x), int(y), max(int(width), 1), max(int(height), 1)
+
+
+def _full_frame(frame_shape):
+    return 0, 0, frame_shape[1], frame_shape[0]
+
+
+def _read_batches(path, batch_size, batches, stop):
+    # Decoding runs here, overlapping inference on the caller's thread.
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = []
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if ok:
+                frames.append(frame)
+            if frames and (not ok or len(frames) == batch_size):
+                _put_unless_stopped(batches, frames, stop)
+                frames = []
+            if not ok:
+                break
+    finally:
+        cap.release()
+        _put_unless_stopped(batches, None, stop)
+
+
+def _put_unless_stopped(batches, item, stop):
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def estimate_poses(path, model, batch_size=8, roi=True):
+    """Keypoints and confidences of every frame of `path`, in presentation order.
+
+    With `roi`, each batch is cropped to the subject's box in the previous
+    batch; the first batch, and any after the subject is lost, see the
+    whole frame.
+    """
+    batches = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_batches, args=(path, batch_size, batches, stop),
+                              name=f"pose-reader:{path}", daemon=True)
+    reader.start()
+    keypoints, confidence = [], []
+    box = None
+    try:
+        while (frames := batches.get()) is not None:
+            if box is None: box = _full_frame(frames[0].shape)
+            batch_keypoints, batch_confidence = model.infer(model.blob(frames, box), box)
+            box = person_box(batch_keypoints, batch_confidence, frames[0].shape, model.roi_aspect) if roi else None
+            keypoints.append(batch_keypoints)
+            confidence.append(batch_confidence)
+    finally:
+        # Also on errors from the model: release the reader and its capture.
+        stop.set()
+        while not batches.empty():
+            batches.get_nowait()
+        reader.join()
+    if not keypoints:
+        return np.zeros((0, len(BODY_25), 2), np.float32), np.zeros((0, len(BODY_25)), np.float32)
+    return np.concatenate(keypoints), np.concatenate(confidence)
+
+
+def track_poses(path, model, interval=5, roi=True, min_tracked=0.7, max_error=30.0):
+    """Keypoints of every frame of `path`, detected every `interval` frames and tracked in between.
+
+    Between detections the keypoints are carried forward with pyramidal
+    Lucas-Kanade optical flow and keep the confidence of their detection;
+    keypoints the flow loses drop to zero confidence. The model runs early
+    when fewer than `min_tracked` of the confident keypoints survive a step.
+    With `roi`, detections are cropped to the subject's box around the
+    current keypoints. Returns keypoints, confidences and the number of
+    detections.
+    """
+    cap = cv2.VideoCapture(path)
+    keypoints, confidence = [], []
+    detections, since_detection = 0, 0
+    previous = points = scores = None
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            detect = points is None or since_detection >= interval
+            if not detect:
+                tracked, status, error = cv2.calcOpticalFlowPyrLK(previous, gray, points.reshape(-1, 1, 2), None,
+                                                                  winSize=(21, 21), maxLevel=3)
+                good = (status[:, 0] == 1) & (error[:, 0] < max_error)
+                confident = scores >= MIN_CONFIDENCE
+                if confident.any() and good[confident].mean() < min_tracked:
+                    detect = True
+                else:
+                    points = np.where(good[:, None], tracked[:, 0], points)
+                    scores = np.where(good, scores, 0)
+            if detect:
+                box = person_box(points, scores, frame.shape, model.roi_aspect) if roi and points is not None else None
+                if box is None: box = _full_frame(frame.shape)
+                batch_keypoints, batch_confidence = model.infer(model.blob([frame], box), box)
+                points, scores = batch_keypoints[0], batch_confidence[0]
+                detections, since_detection = detections + 1, 0
+            since_detection += 1
+            previous = gray
+            keypoints.append(points)
+            confidence.append(scores)
+    finally:
+        cap.release()
+    if not keypoints:
+        return np.zeros((0, len(BODY_25), 2), np.float32), np.zeros((0, len(BODY_25)), np.float32), 0
+    return np.stack(keypoints).astype(np.float32), np.stack(confidence).astype(np.float32), detections
+
+
+def _signed_angle(a, b):
+    """Counter-clockwise angle in degrees from vectors `a` to `b` (image coordinates, y down)."""
+    cross = a[..., 1] * b[..., 0] - a[..., 0] * b[..., 1]
+    dot = (a * b).sum(axis=-1)
+    return np.degrees(np.arctan2(cross, dot))
+
+
+def _fill_gaps(row):
+    valid = np.isfinite(row)
+    if not valid.any():
+        return np.zeros_like(row)
+    if valid.all():
+        return row
+    index = np.arange(len(row))
+    return np.interp(index, index[valid], row[valid])
+
+
+def joint_angles(keypoints, confidence, min_confidence=MIN_CONFIDENCE):
+    """The six sagittal joint angles of every frame, as a (6 x frames) matrix in `gait.JOINTS` order.
+
+    Angles are in degrees with the dashboard's conventions: hip flexion is
+    the thigh's angle in front of the trunk, knee flexion is 0 at full
+    extension and ankle dorsiflexion is 0 with the foot at right angles to
+    the shank. The walking direction is taken from the feet (heel to big
+    toe). Samples whose keypoints fall below `min_confidence` are
+    interpolated from their neighbours.
+    """
+    points = np.where((confidence >= min_confidence)[..., None], keypoints, np.nan)
+    k = KEYPOINT
+    trunk = points[:, k["MidHip"]] - points[:, k["Neck"]]
+    feet = np.concatenate([points[:, k[f"{side}BigToe"]] - points[:, k[f"{side}Heel"]] for side in "LR"])
+    facing = 1.0 if np.isnan(feet[:, 0]).all() or np.nanmedian(feet[:, 0]) >= 0 else -1.0
+    angles = {}
+    for side, name in [("L", "Left"), ("R", "Right")]:
+        hip, knee, ankle = points[:, k[f"{side}Hip"]], points[:, k[f"{side}Knee"]], points[:, k[f"{side}Ankle"]]
+        thigh, shank = knee - hip, ankle - knee
+        foot = points[:, k[f"{side}BigToe"]] - points[:, k[f"{side}Heel"]]
+        angles[f"{name} Hip Flexion"] = facing * _signed_angle(trunk, thigh)
+        angles[f"{name} Knee Flexion"] = facing * _signed_angle(shank, thigh)
+        angles[f"{name} Ankle Dorsiflexion"] = facing * _signed_angle(shank, foot) - 90
+    return np.stack([_fill_gaps(angles[name]) for name in JOINTS])
+
+
+def content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pose_cache_path(path):
+    return path + ".pose.npz"
+
+
+def extract_gait_data(path, model, batch_size=8, interval=1, roi=True):
+    """JointAngles of the subject in `path`, estimated by `model`.
+
+    With `interval` 1 every frame goes through the model in batches; above
+    that the model runs every `interval` frames and keypoints are tracked in
+    between (see `track_poses`). With `roi` the model only sees a crop around
+    the subject. Results are saved beside the video as `<video>.pose.npz`
+    and reused while the video's content hash, the model and these settings
+    are unchanged.
+    """
+    key = f"{content_hash(path)}:{model.identity}:{interval}:{roi}"
+    try:
+        with np.load(pose_cache_path(path)) as saved:
+            if str(saved["key"]) == key:
+                return JointAngles(saved["times"], saved["values"])
+    except (OSError, KeyError, ValueError):
+        pass
+    if interval > 1:
+        keypoints, confidence, _ = track_poses(path, model, interval, roi)
+    else:
+        keypoints, confidence = estimate_poses(path, model, batch_size, roi)
+    if not len(keypoints):
+        raise ValueError(f"no frames could be decoded from {path}")
+    times = FrameIndex.load(path).timestamps_ms[:len(keypoints)] / 1000
+    data = JointAngles(times, joint_angles(keypoints, confidence))
+    try:
+        np.savez(pose_cache_path(path), key=key, times=data.times, values=data.values,
+                 keypoints=keypoints, confidence=confidence)
+    except OSError:
+        pass
+    return data